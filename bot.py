@@ -3,29 +3,492 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
 import requests
+import urllib3
 import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple, Counter, deque, OrderedDict
+from datetime import datetime
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Потоковый разбор выгоден только с C-бэкендом ijson, иначе orjson/json быстрее
+STREAM_LISTS = ijson is not None and ijson.backend == "yajl2_c"
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_URL = os.getenv("API_URL")
+DEBOUNCE_WINDOW = float(os.getenv("DEBOUNCE_WINDOW", "1.0"))
+ACTION_TTL = float(os.getenv("ACTION_TTL", "600"))
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "2.0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+UPDATE_DEADLINE = float(os.getenv("UPDATE_DEADLINE", "10"))
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "5"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "8"))
+STALE_CACHE_SIZE = int(os.getenv("STALE_CACHE_SIZE", "256"))
+STALE_CACHE_TTL = float(os.getenv("STALE_CACHE_TTL", "3600"))
+
+update_timings = contextvars.ContextVar("update_timings", default=None)
+update_budget = contextvars.ContextVar("update_budget", default=None)
+
+class UpdateTimings:
+    __slots__ = ("update_id", "kind", "started", "loop_cpu_started", "backend", "telegram", "stack",
+                 "task", "backend_thread")
+
+    def __init__(self, update_id, kind):
+        self.update_id = update_id
+        self.kind = kind
+        self.started = time.perf_counter()
+        # CPU всего потока цикла событий, включая параллельно обрабатываемые обновления
+        self.loop_cpu_started = time.thread_time()
+        self.backend = 0.0
+        self.telegram = 0.0
+        self.stack = None
+        self.task = None
+        self.backend_thread = None
+
+def record_backend_time(started):
+    timings = update_timings.get()
+    if timings is not None:
+        timings.backend += time.perf_counter() - started
+
+class UpdateBudget:
+    __slots__ = ("deadline", "stale")
+
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds
+        self.stale = False
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+class BackendUnavailable(requests.RequestException):
+    pass
+
+class DeadlineExceeded(BackendUnavailable):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, name, max_failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"Эндпоинт {self.name} снова доступен")
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.opened_at is not None or self.failures >= self.max_failures:
+                if self.opened_at is None:
+                    logger.warning(f"Эндпоинт {self.name} недоступен, запросы временно отключены на {self.reset_timeout} с")
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        with self.lock:
+            self.trial = False
+
+class BackendSession(requests.Session):
+    def __init__(self):
+        super().__init__()
+        self.breakers = {}
+
+    def breaker_for(self, url):
+        path = url[len(API_URL):] if API_URL and url.startswith(API_URL) else urlsplit(url).path
+        name = path.split("?")[0].strip("/").split("/")[0]
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers.setdefault(name, CircuitBreaker(name))
+        return breaker
+
+    def request(self, method, url, *args, **kwargs):
+        timeout = BACKEND_TIMEOUT
+        budget_limited = False
+        budget = update_budget.get()
+        if budget is not None:
+            remaining = budget.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Время на обработку обновления истекло: {method} {url}")
+            if remaining < timeout:
+                timeout = remaining
+                budget_limited = True
+        kwargs.setdefault("timeout", timeout)
+
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            raise BackendUnavailable(f"Эндпоинт {breaker.name} временно отключён: {method} {url}")
+
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.Timeout:
+            # Таймаут, урезанный остатком бюджета, не говорит о неисправности эндпоинта
+            if budget_limited:
+                breaker.release_trial()
+            else:
+                breaker.record_failure()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            record_backend_time(started)
+
+        if response.status_code >= 500:
+            breaker.record_failure()
+        elif not kwargs.get("stream"):
+            # Для stream=True исход известен только после чтения тела, его фиксирует _fetch
+            breaker.record_success()
+        response.budget_limited = budget_limited
+        return response
+
+class TimedBot(Bot):
+    async def request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().request(*args, **kwargs)
+        finally:
+            timings = update_timings.get()
+            if timings is not None:
+                timings.telegram += time.perf_counter() - started
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def format_frame(frame):
+    return f"{frame.f_code.co_filename}:{frame.f_lineno} {frame.f_code.co_name}"
+
+def format_stack(frame):
+    lines = []
+    while frame is not None:
+        lines.append(format_frame(frame))
+        frame = frame.f_back
+    return list(reversed(lines))
+
+def format_task_stack(task):
+    # Цепочка cr_await показывает, где сейчас ждёт корутина обновления
+    lines = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        lines.append(format_frame(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return lines
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.total = 0
+        self.started_at = None
+        self.thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        self.samples.clear()
+        self.total = 0
+        self.started_at = datetime.now()
+        self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread in threading.enumerate():
+                if thread.ident == self.thread_id:
+                    label = "loop"
+                elif thread.name.startswith("backend"):
+                    label = "backend"
+                else:
+                    continue
+                frame = frames.get(thread.ident)
+                if frame is None:
+                    continue
+                stack = collapse_stack(frame)
+                # Простаивающие потоки пула ждут задачу прямо в _worker
+                if label == "backend" and stack.endswith("thread.py:_worker"):
+                    continue
+                self.samples[f"{label};{stack}"] += 1
+            self.total += 1
+
+api = BackendSession()
+backend_executor = ThreadPoolExecutor(max_workers=BACKEND_WORKERS, thread_name_prefix="backend")
+
+def _run_in_worker(func, *args, **kwargs):
+    timings = update_timings.get()
+    if timings is None:
+        return func(*args, **kwargs)
+    timings.backend_thread = threading.get_ident()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings.backend_thread = None
+
+async def run_backend(func, *args, **kwargs):
+    # Синхронные запросы выполняются в отдельном пуле, чтобы зависший бэкенд не блокировал цикл событий
+    budget = update_budget.get()
+    if budget is not None and budget.remaining() <= 0:
+        raise DeadlineExceeded("Время на обработку обновления истекло до обращения к бэкенду")
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(backend_executor, functools.partial(context.run, _run_in_worker, func, *args, **kwargs))
+    if budget is None:
+        return await future
+    try:
+        # Ожидание свободного потока тоже входит в бюджет обновления
+        return await asyncio.wait_for(future, budget.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Время на обработку обновления истекло в очереди к бэкенду")
+
+async def api_get(url, **kwargs):
+    return await run_backend(api.get, url, **kwargs)
+
+async def api_post(url, **kwargs):
+    return await run_backend(api.post, url, **kwargs)
 
-bot = Bot(token=BOT_TOKEN)
+bot = TimedBot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
+class DeadlineMiddleware(BaseMiddleware):
+    def __init__(self, seconds=UPDATE_DEADLINE):
+        super().__init__()
+        self.seconds = seconds
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        update_budget.set(UpdateBudget(self.seconds))
+
 class LoggingMiddleware(BaseMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
         logger.info(f"Получено сообщение: {message.text} от пользователя {message.from_user.id}")
 
+class DebounceMiddleware(BaseMiddleware):
+    def __init__(self, window=DEBOUNCE_WINDOW, max_keys=10000):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self.last_taps = {}
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        key = (callback_query.from_user.id, callback_query.data)
+        now = time.monotonic()
+        last = self.last_taps.get(key)
+        if last is not None and now - last < self.window:
+            logger.info(f"Повторное нажатие {callback_query.data} от пользователя {callback_query.from_user.id} пропущено")
+            await callback_query.answer()
+            raise CancelHandler()
+
+        if len(self.last_taps) >= self.max_keys:
+            self.last_taps = {k: t for k, t in self.last_taps.items() if now - t < self.window}
+        self.last_taps[key] = now
+
+class SlowUpdateMiddleware(BaseMiddleware):
+    def __init__(self, threshold=SLOW_UPDATE_THRESHOLD, keep=50):
+        super().__init__()
+        self.threshold = threshold
+        self.recent = deque(maxlen=keep)
+        self.active = {}
+        self._watchdog = None
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if update.callback_query:
+            kind = f"callback {update.callback_query.data}"
+        elif update.message:
+            kind = f"message {(update.message.text or '')[:50]}"
+        else:
+            kind = "update"
+        timings = UpdateTimings(update.update_id, kind)
+        timings.task = asyncio.current_task()
+        update_timings.set(timings)
+        self.active[update.update_id] = timings
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="slow-update-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def on_post_process_update(self, update: types.Update, result, data: dict):
+        self.finish(update)
+
+    async def on_pre_process_error(self, update: types.Update, exception, data: dict):
+        self.finish(update)
+
+    def finish(self, update):
+        timings = self.active.pop(update.update_id, None)
+        if timings is None:
+            return
+        total = time.perf_counter() - timings.started
+        if total < self.threshold:
+            return
+        entry = {
+            "update_id": timings.update_id,
+            "kind": timings.kind,
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "total": total,
+            "backend": timings.backend,
+            "telegram": timings.telegram,
+            "handler": max(total - timings.backend - timings.telegram, 0.0),
+            "loop_cpu": time.thread_time() - timings.loop_cpu_started,
+            "stack": timings.stack or [],
+        }
+        self.recent.append(entry)
+        logger.warning(f"Медленное обновление {entry['update_id']} ({entry['kind']}): всего {total:.3f}с, "
+                       f"бэкенд {entry['backend']:.3f}с, Telegram {entry['telegram']:.3f}с, "
+                       f"обработчик {entry['handler']:.3f}с")
+
+    def _watch(self):
+        interval = max(self.threshold / 4, 0.05)
+        while True:
+            time.sleep(interval)
+            now = time.perf_counter()
+            for timings in list(self.active.values()):
+                if timings.stack is None and now - timings.started >= self.threshold:
+                    timings.stack = self.capture(timings)
+
+    def capture(self, timings):
+        stack = []
+        if timings.task is not None:
+            stack.append("task:")
+            stack.extend(format_task_stack(timings.task))
+        backend_thread = timings.backend_thread
+        frame = sys._current_frames().get(backend_thread) if backend_thread is not None else None
+        if frame is not None:
+            stack.append("backend:")
+            stack.extend(format_stack(frame))
+        return stack
+
+def write_profile_report(profiler, slow_updates, duration):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile-{profiler.started_at:%Y%m%d-%H%M%S}.txt")
+    with open(path, "w", encoding="utf-8") as report:
+        report.write(f"# profile started={profiler.started_at.isoformat(timespec='seconds')} "
+                     f"duration={duration}s interval={profiler.interval * 1000:.0f}ms samples={profiler.total}\n")
+
+        report.write("\n## functions (self / total samples)\n")
+        own, inclusive = Counter(), Counter()
+        for stack, count in profiler.samples.items():
+            names = stack.split(";")
+            own[names[-1]] += count
+            for name in set(names):
+                inclusive[name] += count
+        for name, count in sorted(inclusive.items(), key=lambda item: (-item[1], item[0])):
+            report.write(f"{own[name]:>8} {count:>8}  {name}\n")
+
+        report.write("\n## stacks (collapsed)\n")
+        for stack, count in sorted(profiler.samples.items(), key=lambda item: (-item[1], item[0])):
+            report.write(f"{stack} {count}\n")
+
+        report.write(f"\n## slow updates (threshold {SLOW_UPDATE_THRESHOLD}s)\n")
+        for entry in slow_updates:
+            report.write(f"{entry['at']} update={entry['update_id']} {entry['kind']}: total={entry['total']:.3f}s "
+                         f"backend={entry['backend']:.3f}s telegram={entry['telegram']:.3f}s "
+                         f"handler={entry['handler']:.3f}s loop_cpu={entry['loop_cpu']:.3f}s\n")
+            for line in entry["stack"]:
+                report.write(f"    {line}\n")
+    return path
+
+class ActionLocks:
+    def __init__(self, ttl=ACTION_TTL):
+        self.ttl = ttl
+        self.pending = set()
+        self.done = {}
+
+    def acquire(self, key):
+        self.sweep(time.monotonic())
+        if key in self.pending or key in self.done:
+            return False
+        self.pending.add(key)
+        return True
+
+    def release(self, key, done=False):
+        self.pending.discard(key)
+        if done:
+            # Ключи в done упорядочены по времени завершения, устаревшие всегда в начале
+            self.done.pop(key, None)
+            self.done[key] = time.monotonic()
+
+    def sweep(self, now):
+        while self.done:
+            key, finished_at = next(iter(self.done.items()))
+            if now - finished_at < self.ttl:
+                break
+            del self.done[key]
+
+    def is_done(self, key):
+        finished_at = self.done.get(key)
+        return finished_at is not None and time.monotonic() - finished_at < self.ttl
+
+slow_updates = SlowUpdateMiddleware()
+dp.middleware.setup(DeadlineMiddleware())
+dp.middleware.setup(slow_updates)
 dp.middleware.setup(LoggingMiddleware())
+dp.middleware.setup(DebounceMiddleware())
+action_locks = ActionLocks()
+profiler = SamplingProfiler()
 
 main_menu = ReplyKeyboardMarkup(resize_keyboard=True).add(
     KeyboardButton("🏙️ Города"),
@@ -54,7 +517,7 @@ class UserStates(StatesGroup):
 async def start(message: types.Message):
     telegram_user_id = message.from_user.id
 
-    response = requests.get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}")
+    response = await api_get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}")
     if response.status_code != 404:
         participants = response.json()
         if participants:
@@ -65,7 +528,7 @@ async def start(message: types.Message):
             "LastName": message.from_user.last_name or "",
             "TelegramUserID": telegram_user_id
         }
-        response = requests.post(f"{API_URL}participants/", json=user_data)
+        response = await api_post(f"{API_URL}participants/", json=user_data)
         if response.status_code == 201:
             await message.answer("🎉 Добро пожаловать! Вы были успешно зарегистрированы. Выберите действие:",
                                  reply_markup=main_menu)
@@ -75,6 +538,48 @@ async def start(message: types.Message):
 
     await UserStates.main_menu.set()
 
+async def finish_profiling(chat_id, duration):
+    await asyncio.sleep(duration)
+    profiler.stop()
+    slow = [entry for entry in slow_updates.recent if entry["at"] >= profiler.started_at.isoformat(timespec="seconds")]
+    try:
+        path = write_profile_report(profiler, slow, duration)
+        await bot.send_document(chat_id, types.InputFile(path), caption=f"📊 Профиль за {duration} с")
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении профиля: {e}")
+        await bot.send_message(chat_id, "❌ Не удалось сохранить профиль.")
+
+@dp.message_handler(commands=["profile"], state="*")
+async def profile_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    if profiler.running:
+        await message.answer("⏳ Профилирование уже запущено.")
+        return
+
+    args = message.get_args()
+    duration = int(args) if args.isdigit() else 30
+    duration = max(1, min(duration, 600))
+
+    profiler.start()
+    asyncio.create_task(finish_profiling(message.chat.id, duration))
+    await message.answer(f"📊 Профилирование запущено на {duration} с.")
+
+@dp.message_handler(commands=["slow"], state="*")
+async def slow_updates_command(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    if not slow_updates.recent:
+        await message.answer(f"✅ Обновлений дольше {SLOW_UPDATE_THRESHOLD} с не было.")
+        return
+
+    lines = [f"{entry['at']} {entry['kind']}: {entry['total']:.2f}с (бэкенд {entry['backend']:.2f}с, "
+             f"Telegram {entry['telegram']:.2f}с, обработчик {entry['handler']:.2f}с)"
+             for entry in list(slow_updates.recent)[-10:]]
+    await message.answer("🐢 Последние медленные обновления:\n" + "\n".join(lines))
+
 @dp.message_handler(state=UserStates.main_menu)
 async def main_menu_handler(message: types.Message, state: FSMContext):
     if message.text == "🏙️ Города":
@@ -97,13 +602,188 @@ def paginate_text(text, chunk_size=1000):
 def paginate_list(items, items_per_page=5):
     return [items[i:i + items_per_page] for i in range(0, len(items), items_per_page)]
 
-async def get_unique_countries(api_url):
+def record_type(name, fields):
+    base = namedtuple(name, fields)
+
+    class Record(base):
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            if isinstance(key, str):
+                return getattr(self, key)
+            return base.__getitem__(self, key)
+
+    Record.__name__ = Record.__qualname__ = name
+    return Record
+
+CountryRecord = record_type("CountryRecord", ("Country",))
+CityRecord = record_type("CityRecord", ("CityID", "CityName"))
+QuestRecord = record_type("QuestRecord", ("QuestID", "QuestName"))
+LocationRecord = record_type("LocationRecord", ("LocationID", "LocationName"))
+GuideRecord = record_type("GuideRecord", ("GuideID", "FirstName", "LastName"))
+ReviewRecord = record_type("ReviewRecord", ("ReviewID", "Comment", "Rating"))
+
+class BudgetReader:
+    chunk_size = 8192
+
+    def __init__(self, response):
+        response.raw.decode_content = True
+        self.response = response
+        self.raw = response.raw
+        self.budget = update_budget.get()
+        self.sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+        # read1 возвращается после одного приёма данных, а не ждёт заполнения всего буфера
+        self._read = getattr(response.raw, "read1", None) or response.raw.read
+
+    def read(self, size=-1):
+        if self.budget is not None:
+            remaining = self.budget.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded("Время на обработку обновления истекло при чтении ответа")
+            if self.sock is not None:
+                # Медленная отдача по байту сбрасывала бы таймаут сокета, поэтому ограничиваем его остатком бюджета
+                if remaining < BACKEND_TIMEOUT:
+                    self.response.budget_limited = True
+                self.sock.settimeout(min(remaining, BACKEND_TIMEOUT))
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        return self._read(size)
+
+def read_body(response):
+    reader = BudgetReader(response)
+    chunks = []
+    while True:
+        chunk = reader.read()
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+def _stream_records(response, record):
+    # Словари элементов собираются в C-бэкенде по одному и сразу сводятся к нужным полям
+    return [record._make(item.get(field) for field in record._fields)
+            for item in ijson.items(BudgetReader(response), "item", use_float=True)]
+
+def decode_list(response, record):
+    try:
+        if STREAM_LISTS:
+            return _stream_records(response, record)
+        if orjson is not None:
+            items = orjson.loads(read_body(response))
+        else:
+            items = json.loads(read_body(response))
+        return [record._make(item.get(field) for field in record._fields) for item in items]
+    finally:
+        response.close()
+
+def decode_json(response):
+    try:
+        if orjson is not None:
+            return orjson.loads(read_body(response))
+        return json.loads(read_body(response))
+    finally:
+        response.close()
+
+class StaleCache:
+    def __init__(self, max_size=STALE_CACHE_SIZE, max_age=STALE_CACHE_TTL):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at >= self.max_age:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+stale_cache = StaleCache()
+
+def _fetch(url, key, decode):
+    breaker = api.breaker_for(url)
     try:
-        response = requests.get(f"{api_url}cities/")
+        response = api.get(url, stream=True)
+        if response.status_code >= 500:
+            response.close()
+            raise BackendUnavailable(f"Ошибка бэкенда {response.status_code}: {url}")
         if response.status_code != 200:
+            response.close()
+            breaker.record_success()
+            return None
+
+        # Тело ответа при stream=True читается здесь, поэтому это тоже время бэкенда
+        started = time.perf_counter()
+        try:
+            result = decode(response)
+        except DeadlineExceeded:
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            if response.budget_limited and isinstance(e, urllib3.exceptions.TimeoutError):
+                breaker.release_trial()
+            else:
+                breaker.record_failure()
+            raise BackendUnavailable(f"Ошибка при чтении ответа {url}: {e}") from e
+        finally:
+            record_backend_time(started)
+        breaker.record_success()
+    except requests.RequestException as e:
+        return _stale_fallback(url, key, e)
+
+    stale_cache.put(key, result)
+    return result
+
+def _stale_fallback(url, key, error):
+    cached = stale_cache.get(key)
+    if cached is None:
+        raise error
+    logger.warning(f"Бэкенд недоступен ({error}), используются сохранённые данные для {url}")
+    budget = update_budget.get()
+    if budget is not None:
+        budget.stale = True
+    return cached
+
+async def fetch_list(url, record):
+    key = (url, record)
+    try:
+        return await run_backend(_fetch, url, key, lambda response: decode_list(response, record))
+    except DeadlineExceeded as e:
+        return _stale_fallback(url, key, e)
+
+async def fetch_json(url):
+    key = (url, None)
+    try:
+        return await run_backend(_fetch, url, key, decode_json)
+    except DeadlineExceeded as e:
+        return _stale_fallback(url, key, e)
+
+def data_is_stale():
+    budget = update_budget.get()
+    return budget is not None and budget.stale
+
+def stale_note(stale=False):
+    if stale or data_is_stale():
+        return "\n\n⚠️ Данные могут быть неактуальны."
+    return ""
+
+async def get_unique_countries(api_url):
+    try:
+        cities = await fetch_list(f"{api_url}cities/", CountryRecord)
+        if cities is None:
             return []
-        cities = response.json()
-        countries = list(set(city["Country"] for city in cities))
+        countries = list(set(city.Country for city in cities))
         return countries
     except Exception as e:
         logger.error(f"Ошибка при получении списка стран: {e}")
@@ -111,11 +791,10 @@ async def get_unique_countries(api_url):
 
 async def get_unique_cities(api_url):
     try:
-        response = requests.get(f"{api_url}cities/")
-        if response.status_code != 200:
+        cities = await fetch_list(f"{api_url}cities/", CityRecord)
+        if cities is None:
             return []
-        cities = response.json()
-        unique_cities = list(set(city["CityName"] for city in cities))
+        unique_cities = list(set(city.CityName for city in cities))
         return unique_cities
     except Exception as e:
         logger.error(f"Ошибка при получении списка городов: {e}")
@@ -123,12 +802,7 @@ async def get_unique_cities(api_url):
 
 async def get_unique_quests(api_url):
     try:
-        response = requests.get(f"{api_url}quests/")
-        if response.status_code != 200:
-            return []
-        quests = response.json()
-        unique_quests = [{'QuestID': quest['QuestID'], 'QuestName': quest['QuestName']} for quest in quests]
-        return unique_quests
+        return await fetch_list(f"{api_url}quests/", QuestRecord) or []
     except Exception as e:
         logger.error(f"Ошибка при получении списка квестов: {e}")
         return []
@@ -145,7 +819,7 @@ async def handle_cities(message: types.Message, state: FSMContext):
             keyboard.add(InlineKeyboardButton(country, callback_data=f"filter_country_{country}"))
         keyboard.add(InlineKeyboardButton("🌍 Показать все города", callback_data="filter_country_all"))
 
-        await message.answer("🌍 Выберите страну для фильтрации городов:", reply_markup=keyboard)
+        await message.answer(f"🌍 Выберите страну для фильтрации городов:{stale_note()}", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Ошибка при обработке городов: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
@@ -163,7 +837,7 @@ async def handle_quests(message: types.Message, state: FSMContext):
             keyboard.add(InlineKeyboardButton(city, callback_data=f"filter_quest_city_{city}"))
         keyboard.add(InlineKeyboardButton("🌍 Показать все квесты", callback_data="filter_quest_city_all"))
 
-        await message.answer("🔍 Выберите город для фильтрации квестов:", reply_markup=keyboard)
+        await message.answer(f"🔍 Выберите город для фильтрации квестов:{stale_note()}", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Ошибка при обработке квестов: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
@@ -181,7 +855,7 @@ async def handle_locations(message: types.Message, state: FSMContext):
             keyboard.add(InlineKeyboardButton(city, callback_data=f"filter_city_{city}"))
         keyboard.add(InlineKeyboardButton("🌍 Показать все локации", callback_data="filter_city_all"))
 
-        await message.answer("📍 Выберите город для фильтрации локаций:", reply_markup=keyboard)
+        await message.answer(f"📍 Выберите город для фильтрации локаций:{stale_note()}", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Ошибка при обработке локаций: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
@@ -189,13 +863,12 @@ async def handle_locations(message: types.Message, state: FSMContext):
 async def handle_guides(message: types.Message, state: FSMContext):
     await UserStates.guides.set()
     try:
-        response = requests.get(f"{API_URL}guides/")
-        if response.status_code != 200:
+        guides = await fetch_list(f"{API_URL}guides/", GuideRecord)
+        if guides is None:
             await message.answer("❌ Ошибка при получении списка гидов. Попробуйте позже.")
             return
-        guides = response.json()
         guides_pages = paginate_list(guides)
-        await state.update_data(pages=guides_pages, current_page=0, prefix="guide")
+        await state.update_data(pages=guides_pages, current_page=0, prefix="guide", pages_stale=data_is_stale())
         await send_paginated_list(message.from_user.id, guides_pages[0], "guide", state)
     except Exception as e:
         logger.error(f"Ошибка при получении списка гидов: {e}")
@@ -216,7 +889,7 @@ async def handle_reviews(message: types.Message, state: FSMContext):
         keyboard.add(InlineKeyboardButton("🌍 Показать все отзывы", callback_data="filter_review_quest_all"))
         keyboard.add(InlineKeyboardButton("📝 Добавить отзыв", callback_data="add_review"))
 
-        await message.answer("📝 Выберите квест для фильтрации отзывов или добавьте новый отзыв:", reply_markup=keyboard)
+        await message.answer(f"📝 Выберите квест для фильтрации отзывов или добавьте новый отзыв:{stale_note()}", reply_markup=keyboard)
     except Exception as e:
         logger.error(f"Ошибка при обработке отзывов: {e}")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
@@ -242,7 +915,8 @@ async def send_paginated_list(user_id, items, prefix, state: FSMContext):
         InlineKeyboardButton("Вперед ➡️", callback_data=f"{prefix}_next_page")
     )
     keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
-    await bot.send_message(user_id, f"Выберите {prefix}:", reply_markup=keyboard)
+    stale = (await state.get_data()).get("pages_stale", False)
+    await bot.send_message(user_id, f"Выберите {prefix}:{stale_note(stale)}", reply_markup=keyboard)
 
 @dp.callback_query_handler(lambda c: c.data.endswith("_prev_page") or c.data.endswith("_next_page"), state="*")
 async def pagination_handler(callback_query: types.CallbackQuery, state: FSMContext):
@@ -276,7 +950,7 @@ async def support_message_handler(message: types.Message, state: FSMContext):
     user_message = message.text
     telegram_user_id = message.from_user.id
 
-    participant_response = requests.get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
+    participant_response = await api_get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
     if participant_response.status_code != 200:
         await message.answer("❌ Ошибка при получении данных пользователя. Попробуйте позже.")
         return
@@ -288,7 +962,7 @@ async def support_message_handler(message: types.Message, state: FSMContext):
         "ParticipantID": participant_id,
         "QuestionText": user_message
     }
-    response = requests.post(f"{API_URL}questions/", json=question_data)
+    response = await api_post(f"{API_URL}questions/", json=question_data)
 
     if response.status_code == 201:
         await message.answer("📩 Спасибо за ваш вопрос! Мы свяжемся с вами в ближайшее время.")
@@ -304,13 +978,13 @@ async def city_callback_handler(callback_query: types.CallbackQuery, state: FSMC
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
     try:
-        response = requests.get(f"{API_URL}cities/{city_id}/")
-        if response.status_code != 200:
+        city = await fetch_json(f"{API_URL}cities/{city_id}/")
+        if city is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации о городе.")
             return
-        city = response.json()
         description_parts = paginate_text(city['Description'])
-        await state.update_data(city_description=description_parts, current_page=0, city_name=city['CityName'])
+        await state.update_data(city_description=description_parts, current_page=0, city_name=city['CityName'],
+                                text_stale=data_is_stale())
         await send_paginated_text(callback_query.from_user.id, city['CityName'], description_parts, 0, state)
     except Exception as e:
         logger.error(f"Ошибка при получении информации о городе: {e}")
@@ -325,13 +999,13 @@ async def quest_callback_handler(callback_query: types.CallbackQuery, state: FSM
     keyboard.add(InlineKeyboardButton("📝 Записаться на квест", callback_data=f"book_quest_{quest_id}"))
     keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
     try:
-        response = requests.get(f"{API_URL}quests/{quest_id}/")
-        if response.status_code != 200:
+        quest = await fetch_json(f"{API_URL}quests/{quest_id}/")
+        if quest is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации о квесте.")
             return
-        quest = response.json()
         description_parts = paginate_text(quest['Description'])
-        await state.update_data(quest_description=description_parts, current_page=0, quest_name=quest['QuestName'])
+        await state.update_data(quest_description=description_parts, current_page=0, quest_name=quest['QuestName'],
+                                text_stale=data_is_stale())
         await send_paginated_text(callback_query.from_user.id, quest['QuestName'], description_parts, 0, state)
         await bot.send_message(callback_query.from_user.id, "Выберите действие:", reply_markup=keyboard)
     except Exception as e:
@@ -345,30 +1019,45 @@ async def book_quest_handler(callback_query: types.CallbackQuery, state: FSMCont
     quest_id = callback_query.data.split("_")[2]
     telegram_user_id = callback_query.from_user.id
 
-    response = requests.get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
-    if response.status_code != 200:
-        await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении данных пользователя. Попробуйте позже.")
+    action_key = ("book_quest", telegram_user_id, quest_id)
+    if not action_locks.acquire(action_key):
+        if action_locks.is_done(action_key):
+            await callback_query.answer("✅ Вы уже записаны на этот квест.")
+        else:
+            await callback_query.answer("⏳ Запись уже выполняется.")
         return
 
-    participant = response.json()
-    participant_id = participant['ParticipantID']
+    booked = False
+    try:
+        response = await api_get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
+        if response.status_code != 200:
+            await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении данных пользователя. Попробуйте позже.")
+            return
 
-    booking_data = {
-        "QuestID": quest_id,
-        "ParticipantID": participant_id
-    }
+        participant = response.json()
+        participant_id = participant['ParticipantID']
 
-    response = requests.post(f"{API_URL}quest-participants/", json=booking_data)
-    if response.status_code == 201:
-        keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
+        booking_data = {
+            "QuestID": quest_id,
+            "ParticipantID": participant_id
+        }
 
-        await bot.send_message(callback_query.from_user.id, "✅ Вы успешно записаны на квест!", reply_markup=keyboard)
-    else:
-        await bot.send_message(callback_query.from_user.id, "❌ Произошла ошибка при записи на квест. Попробуйте позже.")
-        logger.error(f"Ошибка при записи на квест: {response.status_code} - {response.text}")
+        response = await api_post(f"{API_URL}quest-participants/", json=booking_data)
+        if response.status_code == 201:
+            booked = True
+            keyboard = InlineKeyboardMarkup()
+            keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
 
-    await callback_query.answer()
+            await bot.send_message(callback_query.from_user.id, "✅ Вы успешно записаны на квест!", reply_markup=keyboard)
+        else:
+            await bot.send_message(callback_query.from_user.id, "❌ Произошла ошибка при записи на квест. Попробуйте позже.")
+            logger.error(f"Ошибка при записи на квест: {response.status_code} - {response.text}")
+    except requests.RequestException as e:
+        logger.error(f"Ошибка при записи на квест: {e}")
+        await bot.send_message(callback_query.from_user.id, "⚠️ Сервис временно недоступен. Попробуйте позже.")
+    finally:
+        action_locks.release(action_key, done=booked)
+        await callback_query.answer()
 
 @dp.callback_query_handler(lambda c: c.data.startswith("location_"), state=UserStates.locations)
 async def location_callback_handler(callback_query: types.CallbackQuery, state: FSMContext):
@@ -376,14 +1065,13 @@ async def location_callback_handler(callback_query: types.CallbackQuery, state:
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
     try:
-        response = requests.get(f"{API_URL}locations/{location_id}/")
-        if response.status_code != 200:
+        location = await fetch_json(f"{API_URL}locations/{location_id}/")
+        if location is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации о локации.")
             return
-        location = response.json()
         description_parts = paginate_text(location['Description'])
         await state.update_data(location_description=description_parts, current_page=0,
-                                location_name=location['LocationName'])
+                                location_name=location['LocationName'], text_stale=data_is_stale())
         await send_paginated_text(callback_query.from_user.id, location['LocationName'], description_parts, 0, state)
     except Exception as e:
         logger.error(f"Ошибка при получении информации о локации: {e}")
@@ -396,17 +1084,17 @@ async def guide_callback_handler(callback_query: types.CallbackQuery, state: FSM
     guide_id = callback_query.data.split("_")[1]
 
     try:
-        response = requests.get(f"{API_URL}guides/{guide_id}/")
-        if response.status_code != 200:
+        guide = await fetch_json(f"{API_URL}guides/{guide_id}/")
+        if guide is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации о гиде.")
             return
-        guide = response.json()
         guide_info = (
             f"Имя: {guide['FirstName']}\n"
             f"Фамилия: {guide['LastName']}\n"
             f"Телефон: {guide['Phone']}\n"
             f"Email: {guide['Email']}\n"
             f"Опыт: {guide['Experience']} лет"
+            f"{stale_note()}"
         )
         keyboard = InlineKeyboardMarkup()
         keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
@@ -424,17 +1112,16 @@ async def filter_cities_by_country(callback_query: types.CallbackQuery, state: F
         country = callback_query.data.split("_")[-1]
 
         if country == "all":
-            response = requests.get(f"{API_URL}cities/")
+            cities = await fetch_list(f"{API_URL}cities/", CityRecord)
         else:
-            response = requests.get(f"{API_URL}cities/?Country={country}")
+            cities = await fetch_list(f"{API_URL}cities/?Country={country}", CityRecord)
 
-        if response.status_code != 200:
+        if cities is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка городов.")
             return
 
-        cities = response.json()
         cities_pages = paginate_list(cities)
-        await state.update_data(pages=cities_pages, current_page=0, prefix="city")
+        await state.update_data(pages=cities_pages, current_page=0, prefix="city", pages_stale=data_is_stale())
         await send_paginated_list(callback_query.from_user.id, cities_pages[0], "city", state)
     except Exception as e:
         logger.error(f"Ошибка при фильтрации городов: {e}")
@@ -448,14 +1135,13 @@ async def filter_locations_by_city(callback_query: types.CallbackQuery, state: F
         city = callback_query.data.split("_")[-1]
 
         if city == "all":
-            response = requests.get(f"{API_URL}locations/")
+            locations = await fetch_list(f"{API_URL}locations/", LocationRecord)
         else:
-            cities_response = requests.get(f"{API_URL}cities/")
-            if cities_response.status_code != 200:
+            cities = await fetch_list(f"{API_URL}cities/", CityRecord)
+            if cities is None:
                 await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка городов.")
                 return
 
-            cities = cities_response.json()
             city_id = None
             for c in cities:
                 if c["CityName"] == city:
@@ -466,15 +1152,14 @@ async def filter_locations_by_city(callback_query: types.CallbackQuery, state: F
                 await bot.send_message(callback_query.from_user.id, "❌ Город не найден.")
                 return
 
-            response = requests.get(f"{API_URL}locations/?CityID={city_id}")
+            locations = await fetch_list(f"{API_URL}locations/?CityID={city_id}", LocationRecord)
 
-        if response.status_code != 200:
+        if locations is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка локаций.")
             return
 
-        locations = response.json()
         locations_pages = paginate_list(locations)
-        await state.update_data(pages=locations_pages, current_page=0, prefix="location")
+        await state.update_data(pages=locations_pages, current_page=0, prefix="location", pages_stale=data_is_stale())
         await send_paginated_list(callback_query.from_user.id, locations_pages[0], "location", state)
     except Exception as e:
         logger.error(f"Ошибка при фильтрации локаций: {e}")
@@ -488,14 +1173,13 @@ async def filter_quests_by_city(callback_query: types.CallbackQuery, state: FSMC
         city = callback_query.data.split("_")[-1]
 
         if city == "all":
-            response = requests.get(f"{API_URL}quests/")
+            quests = await fetch_list(f"{API_URL}quests/", QuestRecord)
         else:
-            cities_response = requests.get(f"{API_URL}cities/")
-            if cities_response.status_code != 200:
+            cities = await fetch_list(f"{API_URL}cities/", CityRecord)
+            if cities is None:
                 await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка городов.")
                 return
 
-            cities = cities_response.json()
             city_id = None
             for c in cities:
                 if c["CityName"] == city:
@@ -506,15 +1190,14 @@ async def filter_quests_by_city(callback_query: types.CallbackQuery, state: FSMC
                 await bot.send_message(callback_query.from_user.id, "❌ Город не найден.")
                 return
 
-            response = requests.get(f"{API_URL}quests/?CityID={city_id}")
+            quests = await fetch_list(f"{API_URL}quests/?CityID={city_id}", QuestRecord)
 
-        if response.status_code != 200:
+        if quests is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка квестов.")
             return
 
-        quests = response.json()
         quests_pages = paginate_list(quests)
-        await state.update_data(pages=quests_pages, current_page=0, prefix="quest")
+        await state.update_data(pages=quests_pages, current_page=0, prefix="quest", pages_stale=data_is_stale())
         await send_paginated_list(callback_query.from_user.id, quests_pages[0], "quest", state)
     except Exception as e:
         logger.error(f"Ошибка при фильтрации квестов: {e}")
@@ -527,35 +1210,30 @@ async def review_callback_handler(callback_query: types.CallbackQuery, state: FS
     review_id = callback_query.data.split("_")[1]
 
     try:
-        response = requests.get(f"{API_URL}reviews/{review_id}/")
-        if response.status_code != 200:
+        review = await fetch_json(f"{API_URL}reviews/{review_id}/")
+        if review is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации об отзыве.")
             return
 
-        review = response.json()
-
         participant_id = review['ParticipantID']
-        participant_response = requests.get(f"{API_URL}participants/{participant_id}/")
-        if participant_response.status_code != 200:
+        participant = await fetch_json(f"{API_URL}participants/{participant_id}/")
+        if participant is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации об участнике.")
             return
 
-        participant = participant_response.json()
-
         quest_id = review['QuestID']
-        quest_response = requests.get(f"{API_URL}quests/{quest_id}/")
-        if quest_response.status_code != 200:
+        quest = await fetch_json(f"{API_URL}quests/{quest_id}/")
+        if quest is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении информации о квесте.")
             return
 
-        quest = quest_response.json()
-
         review_info = (
             f"Отзыв от: {participant['FirstName']} {participant['LastName']}\n"
             f"Квест: {quest['QuestName']}\n" 
             f"Рейтинг: {review['Rating']}\n"
             f"Комментарий: {review['Comment']}\n"
             f"Дата: {review['ReviewDate']}"
+            f"{stale_note()}"
         )
 
         keyboard = InlineKeyboardMarkup()
@@ -574,17 +1252,16 @@ async def filter_reviews_by_quest(callback_query: types.CallbackQuery, state: FS
         quest_id = callback_query.data.split("_")[-1]
 
         if quest_id == "all":
-            response = requests.get(f"{API_URL}reviews/")
+            reviews = await fetch_list(f"{API_URL}reviews/", ReviewRecord)
         else:
-            response = requests.get(f"{API_URL}reviews/?QuestID={quest_id}")
+            reviews = await fetch_list(f"{API_URL}reviews/?QuestID={quest_id}", ReviewRecord)
 
-        if response.status_code != 200:
+        if reviews is None:
             await bot.send_message(callback_query.from_user.id, "❌ Ошибка при получении списка отзывов.")
             return
 
-        reviews = response.json()
         reviews_pages = paginate_list(reviews)
-        await state.update_data(pages=reviews_pages, current_page=0, prefix="review")
+        await state.update_data(pages=reviews_pages, current_page=0, prefix="review", pages_stale=data_is_stale())
         await send_paginated_list(callback_query.from_user.id, reviews_pages[0], "review", state)
     except Exception as e:
         logger.error(f"Ошибка при фильтрации отзывов: {e}")
@@ -603,9 +1280,10 @@ async def send_paginated_text(user_id, title, text_parts, current_page, state: F
     if current_page < total_pages - 1:
         keyboard.add(InlineKeyboardButton("Вперед ➡️", callback_data="next_page"))
     keyboard.add(InlineKeyboardButton("🏠 Назад в главное меню", callback_data="back_to_main_menu"))
+    note = stale_note((await state.get_data()).get("text_stale", False))
 
     if current_page == 0:
-        message = await bot.send_message(user_id, f"{title}\n\n{text}", reply_markup=keyboard)
+        message = await bot.send_message(user_id, f"{title}\n\n{text}{note}", reply_markup=keyboard)
         await state.update_data(message_id=message.message_id)
     else:
         try:
@@ -613,12 +1291,12 @@ async def send_paginated_text(user_id, title, text_parts, current_page, state: F
             await bot.edit_message_text(
                 chat_id=user_id,
                 message_id=message_id,
-                text=f"{title}\n\n{text}",
+                text=f"{title}\n\n{text}{note}",
                 reply_markup=keyboard
             )
         except Exception as e:
             logger.error(f"Ошибка при редактировании сообщения: {e}")
-            message = await bot.send_message(user_id, f"{title}\n\n{text}", reply_markup=keyboard)
+            message = await bot.send_message(user_id, f"{title}\n\n{text}{note}", reply_markup=keyboard)
             await state.update_data(message_id=message.message_id)
 
     await state.update_data(current_page=current_page)
@@ -660,7 +1338,7 @@ async def add_review_start(callback_query: types.CallbackQuery, state: FSMContex
     for quest in quests:
         keyboard.add(InlineKeyboardButton(quest['QuestName'], callback_data=f"select_quest_{quest['QuestID']}"))
 
-    await callback_query.message.answer("📝 Выберите квест, для которого хотите оставить отзыв:", reply_markup=keyboard)
+    await callback_query.message.answer(f"📝 Выберите квест, для которого хотите оставить отзыв:{stale_note()}", reply_markup=keyboard)
     await callback_query.answer()
 
 @dp.callback_query_handler(lambda c: c.data.startswith("select_quest_"), state=UserStates.add_review_quest)
@@ -697,31 +1375,61 @@ async def enter_review_comment(message: types.Message, state: FSMContext):
 
     telegram_user_id = message.from_user.id
 
-    response = requests.get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
-    if response.status_code != 200:
-        await message.answer("❌ Ошибка при получении данных пользователя. Попробуйте позже.")
+    action_key = ("review", telegram_user_id, quest_id)
+    if not action_locks.acquire(action_key):
+        logger.info(f"Повторная отправка отзыва на квест {quest_id} от пользователя {telegram_user_id} пропущена")
+        if action_locks.is_done(action_key):
+            await message.answer("✅ Вы уже оставили отзыв на этот квест.")
+            await UserStates.main_menu.set()
+            await message.answer("🏠 Выберите следующее действие:", reply_markup=main_menu)
+        else:
+            await message.answer("⏳ Отзыв уже отправляется.")
         return
 
-    participant = response.json()
-    participant_id = participant['ParticipantID']
+    added = False
+    try:
+        response = await api_get(f"{API_URL}participants/by-telegram-id/{telegram_user_id}/")
+        if response.status_code != 200:
+            await message.answer("❌ Ошибка при получении данных пользователя. Попробуйте позже.")
+            return
 
-    review_data = {
-        "QuestID": quest_id,
-        "ParticipantID": participant_id,
-        "Rating": rating,
-        "Comment": comment
-    }
+        participant = response.json()
+        participant_id = participant['ParticipantID']
 
-    response = requests.post(f"{API_URL}reviews/", json=review_data)
-    if response.status_code == 201:
-        await message.answer("✅ Отзыв успешно добавлен!")
-    else:
-        await message.answer("❌ Произошла ошибка при добавлении отзыва. Попробуйте позже.")
-        logger.error(f"Ошибка при добавлении отзыва: {response.status_code} - {response.text}")
+        review_data = {
+            "QuestID": quest_id,
+            "ParticipantID": participant_id,
+            "Rating": rating,
+            "Comment": comment
+        }
+
+        response = await api_post(f"{API_URL}reviews/", json=review_data)
+        if response.status_code == 201:
+            added = True
+            await message.answer("✅ Отзыв успешно добавлен!")
+        else:
+            await message.answer("❌ Произошла ошибка при добавлении отзыва. Попробуйте позже.")
+            logger.error(f"Ошибка при добавлении отзыва: {response.status_code} - {response.text}")
+    finally:
+        action_locks.release(action_key, done=added)
 
     await UserStates.main_menu.set()
     await message.answer("🏠 Выберите следующее действие:", reply_markup=main_menu)
 
+@dp.errors_handler(exception=requests.RequestException)
+async def backend_error_handler(update: types.Update, exception: requests.RequestException):
+    logger.error(f"Ошибка при обращении к бэкенду: {exception}")
+    event = update.callback_query or update.message
+    if event is None:
+        return True
+    try:
+        await bot.send_message(event.from_user.id, "⚠️ Сервис временно недоступен. Попробуйте позже.")
+        if update.callback_query:
+            await update.callback_query.answer()
+    except Exception as e:
+        logger.error(f"Ошибка при уведомлении пользователя: {e}")
+    return True
+
 if __name__ == "__main__":
     logger.info("Запуск бота...")
     executor.start_polling(dp, skip_updates=True)
\ No newline at end of file